@@ -22,9 +22,9 @@ for mile in "${miles[@]}"; do
     if [ $? -eq 0 ]; then
         echo "Python analysis completed successfully for ${mile} mile buffer"
         
-        # Convert GeoJSON to Shapefile
-        echo "Converting GeoJSON to Shapefile for ${mile} mile buffer..."
-        ogr2ogr -f "ESRI Shapefile" "output/${mile}_mile_buffer.shp" "output/${mile}_mile_buffer.geojson"
+        # Convert GeoPackage to Shapefile
+        echo "Converting GeoPackage to Shapefile for ${mile} mile buffer..."
+        ogr2ogr -f "ESRI Shapefile" "output/${mile}_mile_buffer.shp" "output/${mile}_mile_buffer.gpkg"
         
         if [ $? -eq 0 ]; then
             echo "Shapefile conversion completed successfully for ${mile} mile buffer"
@@ -9,16 +9,71 @@ This script allows you to configure:
 """
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
-from shapely.geometry import LineString, MultiLineString
-from shapely.ops import linemerge, unary_union
+import pyproj
+import shapely
+from shapely.geometry import LineString
+from shapely.strtree import STRtree
+import hashlib
 import json
 import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
-def read_specific_shapefiles(data_dir, include_roads=True, include_railways=True):
-    """Read specific shapefiles from the washington directory."""
+try:
+    import numba
+except ImportError:  # optional; a numpy fallback is used below
+    numba = None
+
+# Supported output formats: flag value -> (OGR driver, file extension).
+# The binary formats (GPKG, FlatGeobuf) write far faster than GeoJSON.
+OUTPUT_FORMATS = {
+    'gpkg': ('GPKG', '.gpkg'),
+    'fgb': ('FlatGeobuf', '.fgb'),
+    'geojson': ('GeoJSON', '.geojson'),
+}
+
+# pyproj Transformers are expensive to construct; build each CRS pair once
+# and reuse it for every batch of coordinates
+TRANSFORMER_CACHE = {}
+
+def get_transformer(source_crs, target_crs):
+    """Return a cached pyproj Transformer for the given CRS pair."""
+    key = (str(source_crs), str(target_crs))
+    if key not in TRANSFORMER_CACHE:
+        TRANSFORMER_CACHE[key] = pyproj.Transformer.from_crs(
+            source_crs, target_crs, always_xy=True)
+    return TRANSFORMER_CACHE[key]
+
+def reproject_geometries(geometries, source_crs, target_crs):
+    """Reproject a geometry array with one batched coordinate transform."""
+    geom_array = np.array(geometries, dtype=object)
+    if len(geom_array) == 0:
+        return geom_array
+    transformer = get_transformer(source_crs, target_crs)
+    # 2D and 3D geometries are transformed separately so that Z is carried
+    # through unchanged where present (the trails shapefile is LineString Z)
+    # and never invented where absent
+    has_z = shapely.has_z(geom_array)
+    for mask, include_z in ((~has_z, False), (has_z, True)):
+        if not mask.any():
+            continue
+        coords = shapely.get_coordinates(geom_array[mask], include_z=include_z)
+        x, y = transformer.transform(coords[:, 0], coords[:, 1])
+        columns = [x, y, coords[:, 2]] if include_z else [x, y]
+        geom_array[mask] = shapely.set_coordinates(
+            geom_array[mask], np.column_stack(columns))
+    return geom_array
+
+def read_specific_shapefiles(data_dir, include_roads=True, include_railways=True, bbox=None):
+    """Read specific shapefiles from the washington directory.
+
+    If bbox (in EPSG:4326) is given, only features intersecting it are read.
+    Returns a bare numpy array of EPSG:32610 geometries - the downstream
+    buffering discards attributes anyway, so no GeoDataFrame is built.
+    """
     washington_dir = Path(data_dir) / "washington"
     
     shapefiles_to_read = []
@@ -46,41 +101,80 @@ def read_specific_shapefiles(data_dir, include_roads=True, include_railways=True
     
     for file_type, shapefile in shapefiles_to_read:
         try:
-            gdf = gpd.read_file(shapefile)
-            
-            # Filter out excluded road types if this is a roads file
-            if file_type == 'roads' and 'fclass' in gdf.columns:
-                original_count = len(gdf)
-                gdf = gdf[~gdf['fclass'].isin(excluded_road_types)]
-                filtered_count = original_count - len(gdf)
-                if filtered_count > 0:
-                    print(f"  Excluded {filtered_count} features with road types: {', '.join(excluded_road_types)}")
-            
-            # Ensure we have a consistent CRS for buffering (use UTM Zone 10N for Washington)
-            if gdf.crs != 'EPSG:32610':
-                gdf = gdf.to_crs('EPSG:32610')
-            combined_features.append(gdf)
+            # Filter excluded road classes and out-of-area features in OGR,
+            # so they never get parsed into Python at all
+            where = None
+            if file_type == 'roads':
+                excluded = ', '.join(f"'{fclass}'" for fclass in sorted(excluded_road_types))
+                where = f"fclass NOT IN ({excluded})"
+
+            # fclass must stay selected or OGR cannot evaluate the where clause
+            gdf = gpd.read_file(shapefile, engine='pyogrio', columns=['fclass'],
+                                where=where, bbox=bbox)
+
+            combined_features.append((gdf.geometry.values, gdf.crs))
             print(f"Loaded {len(gdf)} features from {shapefile.name}")
         except Exception as e:
             print(f"Error reading {shapefile}: {e}")
-    
-    if combined_features:
-        # Combine all features into a single GeoDataFrame
-        combined_gdf = pd.concat(combined_features, ignore_index=True)
-        return combined_gdf
-    else:
+
+    if not combined_features:
         raise ValueError("No valid shapefiles found")
 
-def create_buffers(gdf, buffer_distance_miles=5):
-    """Create buffers around all features."""
+    # Concatenate the raw geometry arrays; no pd.concat reboxing. Reproject
+    # to UTM Zone 10N once, over the concatenated result, rather than per file
+    source_crses = [crs for _, crs in combined_features]
+    if all(crs == source_crses[0] for crs in source_crses):
+        combined = np.concatenate([geoms for geoms, _ in combined_features])
+        if source_crses[0] != 'EPSG:32610':
+            combined = reproject_geometries(combined, source_crses[0], 'EPSG:32610')
+        return combined
+
+    # Sources disagree on CRS (unusual): reproject each batch separately
+    return np.concatenate([
+        reproject_geometries(geoms, crs, 'EPSG:32610') if crs != 'EPSG:32610' else geoms
+        for geoms, crs in combined_features])
+
+def buffer_cache_path(data_dir, buffer_distance_miles, include_roads=True,
+                      include_railways=True):
+    """Return the cache file for the buffers of this source/parameter combo.
+
+    The key hashes the source shapefile mtimes plus the buffer distance, so
+    edited inputs or a different --buffer-miles never hit a stale cache.
+    """
+    key_parts = [f"buffer_miles={buffer_distance_miles}"]
+    sources = [Path(data_dir) / "trails" / "Trails.shp"]
+    if include_roads:
+        sources.append(Path(data_dir) / "washington" / "gis_osm_roads_free_1.shp")
+    if include_railways:
+        sources.append(Path(data_dir) / "washington" / "gis_osm_railways_free_1.shp")
+    for source in sources:
+        if source.exists():
+            key_parts.append(f"{source.name}={source.stat().st_mtime}")
+    key = hashlib.sha1("|".join(key_parts).encode()).hexdigest()[:16]
+    return Path("cache") / f"{key}_buffers.fgb"
+
+def create_buffers(geometries, buffer_distance_miles=5):
+    """Create buffers around all features in a geometry array."""
     # Convert miles to meters (1 mile = 1609.34 meters)
     buffer_distance_meters = buffer_distance_miles * 1609.34
-    
-    print(f"Creating {buffer_distance_miles}-mile buffers around {len(gdf)} features...")
-    
-    # Create buffers
-    buffered_geometries = gdf.geometry.buffer(buffer_distance_meters)
-    
+
+    print(f"Creating {buffer_distance_miles}-mile buffers around {len(geometries)} features...")
+
+    # Pre-simplify the inputs: sub-10-m vertex detail is invisible at mile
+    # scale, and buffer cost grows with input vertex count. The tolerance
+    # scales with the radius so the geometric error stays far below it.
+    tolerance = max(5.0, buffer_distance_meters / 200)
+    simplified = shapely.simplify(np.asarray(geometries), tolerance,
+                                  preserve_topology=False)
+
+    # Buffer the whole array in one vectorized C call. The buffers are an
+    # exclusion mask, not cartography: square caps, mitred joins and coarse
+    # quad_segs cut the output vertex count ~4x, which speeds up every
+    # downstream union and difference
+    buffered_geometries = shapely.buffer(simplified, buffer_distance_meters,
+                                         quad_segs=4, cap_style='square',
+                                         join_style='mitre')
+
     # Return individual buffers instead of combining into one
     return buffered_geometries
 
@@ -100,127 +194,330 @@ def read_trails_shapefile(data_dir):
     
     return trails_gdf
 
-def find_non_intersecting_segments(trails_gdf, buffer_geometries, min_length_miles=0.1):
+if numba is not None:
+    # Deliberately not parallel=True: the tile workers already use every
+    # core, and numba's threading layer is not fork-safe alongside the
+    # ProcessPoolExecutor
+    @numba.njit(fastmath=True, cache=True)
+    def lengths_from_coords(coords, offsets):
+        lengths = np.zeros(len(offsets) - 1)
+        for i in range(len(offsets) - 1):
+            total = 0.0
+            for j in range(offsets[i], offsets[i + 1] - 1):
+                dx = coords[j + 1, 0] - coords[j, 0]
+                dy = coords[j + 1, 1] - coords[j, 1]
+                total += (dx * dx + dy * dy) ** 0.5
+            lengths[i] = total
+        return lengths
+else:
+    def lengths_from_coords(coords, offsets):
+        deltas = np.hypot(np.diff(coords[:, 0]), np.diff(coords[:, 1]))
+        cumulative = np.concatenate([[0.0], np.cumsum(deltas)])
+        # The spurious join between consecutive geometries sits at each
+        # offsets[i+1]-1 and is excluded by the subtraction below.
+        # Zero-coordinate geometries would wrap those indices, so they are
+        # masked out and report length 0, like the numba kernel.
+        lengths = np.zeros(len(offsets) - 1)
+        nonempty = offsets[1:] > offsets[:-1]
+        lengths[nonempty] = (cumulative[offsets[1:][nonempty] - 1]
+                             - cumulative[offsets[:-1][nonempty]])
+        return lengths
+
+def segment_lengths(line_geometries):
+    """Planar lengths of a LineString array, computed from the raw coordinates.
+
+    Equivalent to shapely.length for LineStrings, but a flat numpy/numba
+    pass over the coordinate buffer instead of one GEOS call per geometry.
+    """
+    if len(line_geometries) == 0:
+        return np.zeros(0)
+    coords = shapely.get_coordinates(line_geometries)
+    offsets = np.zeros(len(line_geometries) + 1, dtype=np.int64)
+    np.cumsum(shapely.get_num_coordinates(line_geometries), out=offsets[1:])
+    return lengths_from_coords(coords, offsets)
+
+def cascaded_union_all(geometries, chunk_size=200):
+    """Union geometries in chunks, then union the chunk results.
+
+    GEOS union_all on one big flat list grows large intermediate geometries;
+    unioning chunk-by-chunk and then unioning the chunk results gives the
+    same answer much faster.
+    """
+    arr = np.asarray(geometries, dtype=object)
+    if len(arr) <= chunk_size:
+        return shapely.union_all(arr)
+
+    chunk_unions = [shapely.union_all(arr[i:i + chunk_size])
+                    for i in range(0, len(arr), chunk_size)]
+    return shapely.union_all(chunk_unions)
+
+def partition_trails_into_tiles(trail_geoms, trail_positions, max_workers):
+    """Assign trails to a grid of spatial tiles, one trail per tile by centroid."""
+    if len(trail_geoms) == 0:
+        return []
+
+    grid_dim = int(np.ceil(np.sqrt(max_workers)))
+    if grid_dim <= 1 or len(trail_geoms) < grid_dim * grid_dim:
+        return [(trail_geoms, trail_positions)]
+
+    bounds = shapely.bounds(trail_geoms)
+    center_x = (bounds[:, 0] + bounds[:, 2]) / 2
+    center_y = (bounds[:, 1] + bounds[:, 3]) / 2
+
+    span_x = max(center_x.max() - center_x.min(), 1e-9)
+    span_y = max(center_y.max() - center_y.min(), 1e-9)
+    tile_x = np.clip(((center_x - center_x.min()) / span_x * grid_dim).astype(int),
+                     0, grid_dim - 1)
+    tile_y = np.clip(((center_y - center_y.min()) / span_y * grid_dim).astype(int),
+                     0, grid_dim - 1)
+    tile_ids = tile_y * grid_dim + tile_x
+
+    tiles = []
+    for tile_id in np.unique(tile_ids):
+        in_tile = tile_ids == tile_id
+        tiles.append((trail_geoms[in_tile], trail_positions[in_tile]))
+    return tiles
+
+def process_trail_tile(trail_geoms, trail_positions, buffer_array, min_length_meters):
+    """Find surviving segments for one tile of trails (multiprocessing worker).
+
+    Takes plain numpy arrays of shapely geometries so the payload pickles
+    cheaply; returns (positions, geometries) for the segments that survive.
+    """
+    # Index the individual buffers so each trail is only tested against the
+    # buffers near it, instead of one giant dissolved geometry
+    buffer_tree = STRtree(buffer_array)
+
+    # Prepare each buffer once so its internal edge index is reused across
+    # every trail in the tile, instead of re-preparing per tree query
+    shapely.prepare(buffer_array)
+
+    # Bounding-box candidates from the tree, confirmed with prepared
+    # intersects (the prepared buffer goes first so its index is used)
+    cand_trails, cand_buffers = buffer_tree.query(trail_geoms)
+    confirmed = shapely.intersects(buffer_array[cand_buffers], trail_geoms[cand_trails])
+    hit_trails = cand_trails[confirmed]
+    hit_buffers = cand_buffers[confirmed]
+
+    hit_mask = np.zeros(len(trail_geoms), dtype=bool)
+    hit_mask[hit_trails] = True
+
+    # Trails with no buffer hits are kept wholesale, filtered only by length
+    clear_geoms = trail_geoms[~hit_mask]
+    long_enough = segment_lengths(clear_geoms) >= min_length_meters
+    keep_positions = [trail_positions[~hit_mask][long_enough]]
+    keep_geoms = [clear_geoms[long_enough]]
+
+    if len(hit_trails) > 0:
+        # Group the buffer hits per trail (query output is sorted by trail)
+        unique_hits, group_starts = np.unique(hit_trails, return_index=True)
+        buffer_groups = np.split(hit_buffers, group_starts[1:])
+
+        local_unions = np.array(
+            [cascaded_union_all(buffer_array[group]) for group in buffer_groups],
+            dtype=object)
+        hit_geoms = trail_geoms[unique_hits]
+
+        # A trail fully inside its candidate union differences to nothing;
+        # a prepared covers test discards it without building any output
+        # geometry, skipping the most expensive call for that common case
+        shapely.prepare(local_unions)
+        covered = shapely.covers(local_unions, hit_geoms)
+
+        # Difference the remaining trails against their own candidate
+        # unions, all in one element-wise call
+        differences = shapely.difference(hit_geoms[~covered], local_unions[~covered])
+
+        # Explode MultiLineString results and track each part's parent trail
+        parts = shapely.get_parts(differences)
+        parents = np.repeat(trail_positions[unique_hits][~covered],
+                            shapely.get_num_geometries(differences))
+        part_keep = (~shapely.is_empty(parts)) & (segment_lengths(parts) >= min_length_meters)
+
+        keep_positions.append(parents[part_keep])
+        keep_geoms.append(parts[part_keep])
+
+    return np.concatenate(keep_positions), np.concatenate(keep_geoms)
+
+def find_non_intersecting_segments(trails_gdf, buffer_geometries, min_length_miles=0.1,
+                                   max_workers=None):
     """Find trail segments that don't intersect with any of the buffers."""
     print(f"Finding trail segments that don't intersect with buffers (min length: {min_length_miles} miles)...")
-    
+
     min_length_meters = min_length_miles * 1609.34
-    non_intersecting_trails = []
-    
-    # Combine all buffer geometries for intersection testing
-    combined_buffer = unary_union(buffer_geometries)
-    
-    for idx, trail in trails_gdf.iterrows():
-        geom = trail.geometry
-        
-        if geom is None:
-            continue
-            
-        # Check if the trail intersects with any buffer
-        if not geom.intersects(combined_buffer):
-            # Trail doesn't intersect - check if it's long enough
-            if geom.length >= min_length_meters:
-                non_intersecting_trails.append(trail)
-        else:
-            # Trail intersects - find segments that don't intersect
-            if isinstance(geom, LineString):
-                try:
-                    # Use difference operation to get parts outside the buffer
-                    non_intersecting_part = geom.difference(combined_buffer)
-                    
-                    if not non_intersecting_part.is_empty:
-                        # Handle different geometry types returned by difference
-                        segments_to_add = []
-                        if isinstance(non_intersecting_part, LineString):
-                            if non_intersecting_part.length >= min_length_meters:
-                                segments_to_add.append(non_intersecting_part)
-                        elif isinstance(non_intersecting_part, MultiLineString):
-                            for line in non_intersecting_part.geoms:
-                                if line.length >= min_length_meters:
-                                    segments_to_add.append(line)
-                        
-                        # Create new trail records for each valid segment
-                        for segment in segments_to_add:
-                            new_trail = trail.copy()
-                            new_trail.geometry = segment
-                            non_intersecting_trails.append(new_trail)
-                            
-                except Exception as e:
-                    print(f"Error processing trail {idx}: {e}")
-                    continue
-            
-            elif isinstance(geom, MultiLineString):
-                # For MultiLineString, check each line separately
-                for line in geom.geoms:
-                    if not line.intersects(combined_buffer):
-                        if line.length >= min_length_meters:
-                            new_trail = trail.copy()
-                            new_trail.geometry = line
-                            non_intersecting_trails.append(new_trail)
-                    else:
-                        try:
-                            non_intersecting_part = line.difference(combined_buffer)
-                            if not non_intersecting_part.is_empty:
-                                segments_to_add = []
-                                if isinstance(non_intersecting_part, LineString):
-                                    if non_intersecting_part.length >= min_length_meters:
-                                        segments_to_add.append(non_intersecting_part)
-                                elif isinstance(non_intersecting_part, MultiLineString):
-                                    for sub_line in non_intersecting_part.geoms:
-                                        if sub_line.length >= min_length_meters:
-                                            segments_to_add.append(sub_line)
-                                
-                                for segment in segments_to_add:
-                                    new_trail = trail.copy()
-                                    new_trail.geometry = segment
-                                    non_intersecting_trails.append(new_trail)
-                                    
-                        except Exception as e:
-                            print(f"Error processing multiline segment {idx}: {e}")
-                            continue
-    
-    if non_intersecting_trails:
-        result_gdf = gpd.GeoDataFrame(non_intersecting_trails)
-        result_gdf.reset_index(drop=True, inplace=True)
-        
-        # Ensure the result GeoDataFrame has a CRS
-        if result_gdf.crs is None:
-            result_gdf = result_gdf.set_crs('EPSG:32610')
-        
+
+    buffer_array = np.asarray(buffer_geometries)
+
+    geoms = trails_gdf.geometry.values
+    valid_positions = np.flatnonzero(~shapely.is_missing(geoms))
+    valid_geoms = geoms[valid_positions]
+
+    # Explode multi-part trails once so everything downstream operates on
+    # plain LineStrings; each part remembers its parent row
+    part_geoms = shapely.get_parts(valid_geoms)
+    part_positions = np.repeat(valid_positions,
+                               shapely.get_num_geometries(valid_geoms))
+
+    # With nothing to buffer (e.g. the bbox filter matched no roads) every
+    # length-qualifying trail survives; total_bounds would raise on an
+    # empty array, so skip the spatial machinery entirely.
+    if len(buffer_array) == 0:
+        long_enough = segment_lengths(part_geoms) >= min_length_meters
+        return build_segment_gdf(trails_gdf, part_positions[long_enough],
+                                 part_geoms[long_enough])
+
+    # Cheapest reject first: a trail whose bbox is disjoint from the overall
+    # buffer extent is trivially kept, with no tree or GEOS work at all.
+    # Pure vectorized numpy comparisons over an Nx4 bounds array.
+    part_bounds = shapely.bounds(part_geoms)
+    buffer_total = shapely.total_bounds(buffer_array)
+    bbox_disjoint = ((part_bounds[:, 2] < buffer_total[0]) |
+                     (part_bounds[:, 0] > buffer_total[2]) |
+                     (part_bounds[:, 3] < buffer_total[1]) |
+                     (part_bounds[:, 1] > buffer_total[3]))
+
+    clear_geoms = part_geoms[bbox_disjoint]
+    clear_keep = segment_lengths(clear_geoms) >= min_length_meters
+    prefiltered = (part_positions[bbox_disjoint][clear_keep], clear_geoms[clear_keep])
+
+    part_geoms = part_geoms[~bbox_disjoint]
+    part_positions = part_positions[~bbox_disjoint]
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    # Partition the trails into spatial tiles so each worker only handles the
+    # buffers near its own tile. Trails are assigned whole (by centroid), so
+    # no segment is split across tiles and no stitching pass is needed.
+    tiles = partition_trails_into_tiles(part_geoms, part_positions, max_workers)
+
+    # Query candidate buffers per tile once, against the tile's true extent
+    buffer_tree = STRtree(buffer_array)
+    tasks = []
+    for tile_geoms, tile_positions in tiles:
+        tile_bounds = shapely.bounds(tile_geoms)
+        tile_box = shapely.box(tile_bounds[:, 0].min(), tile_bounds[:, 1].min(),
+                               tile_bounds[:, 2].max(), tile_bounds[:, 3].max())
+        candidate_idxs = buffer_tree.query(tile_box, predicate='intersects')
+        tasks.append((tile_geoms, tile_positions, buffer_array[candidate_idxs],
+                      min_length_meters))
+
+    if max_workers > 1 and len(tasks) > 1:
+        print(f"Processing {len(tasks)} spatial tiles on {max_workers} workers...")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(process_trail_tile, *zip(*tasks)))
+    else:
+        results = [process_trail_tile(*task) for task in tasks]
+
+    results.insert(0, prefiltered)
+    keep_positions = np.concatenate([positions for positions, _ in results])
+    keep_geoms = np.concatenate([geoms_out for _, geoms_out in results])
+
+    return build_segment_gdf(trails_gdf, keep_positions, keep_geoms)
+
+def build_segment_gdf(trails_gdf, keep_positions, keep_geoms):
+    """Assemble surviving segments into a GeoDataFrame with parent attributes."""
+    if len(keep_geoms) > 0:
+        # Rebuild the GeoDataFrame in one shot from the surviving rows
+        attributes = trails_gdf.iloc[keep_positions].drop(
+            columns=trails_gdf.geometry.name).reset_index(drop=True)
+        result_gdf = gpd.GeoDataFrame(
+            attributes, geometry=np.asarray(keep_geoms, dtype=object),
+            crs=trails_gdf.crs if trails_gdf.crs is not None else 'EPSG:32610')
+
         print(f"Found {len(result_gdf)} non-intersecting trail segments")
         return result_gdf
     else:
         print("No non-intersecting trail segments found")
         # Return an empty GeoDataFrame with the correct CRS
-        return gpd.GeoDataFrame(crs='EPSG:32610')
-
-def save_geojson(gdf, output_path):
-    """Save GeoDataFrame as GeoJSON."""
-    # Ensure the GeoDataFrame has a CRS before transformation
-    if gdf.crs is None:
-        # Assume UTM Zone 10N if no CRS is set
-        gdf = gdf.set_crs('EPSG:32610')
-    
-    # Convert back to WGS84 for GeoJSON
-    gdf_wgs84 = gdf.to_crs('EPSG:4326')
-    gdf_wgs84.to_file(os.path.join("output", output_path), driver='GeoJSON')
+        return gpd.GeoDataFrame(geometry=[], crs='EPSG:32610')
+
+def find_non_intersecting_segments_raster(trails_gdf, source_geometries, buffer_distance_miles,
+                                          min_length_miles=0.1, resolution=20.0):
+    """Raster-mask variant: dilate rasterized roads/railways instead of buffering.
+
+    Burns the source features onto a binary grid covering the trail extent,
+    computes a distance transform, and thresholds it at the buffer distance -
+    one array pass replaces buffer + union + difference. Trails are sampled
+    along the mask at grid resolution, so segment endpoints are accurate to
+    about one pixel.
+    """
+    # Optional fast path; only pull in the raster stack when it is requested
+    from rasterio import features, transform as rio_transform
+    from scipy import ndimage
+
+    buffer_meters = buffer_distance_miles * 1609.34
+    min_length_meters = min_length_miles * 1609.34
+
+    print(f"Rasterizing exclusion mask at {resolution} m resolution...")
+
+    # Grid covering the trails, padded so nearby off-extent roads still count
+    minx, miny, maxx, maxy = trails_gdf.total_bounds
+    pad = buffer_meters + resolution
+    minx, miny, maxx, maxy = minx - pad, miny - pad, maxx + pad, maxy + pad
+    width = int(np.ceil((maxx - minx) / resolution))
+    height = int(np.ceil((maxy - miny) / resolution))
+    grid_transform = rio_transform.from_origin(minx, maxy, resolution, resolution)
+
+    source_geoms = np.asarray(source_geometries)
+    source_geoms = source_geoms[~shapely.is_missing(source_geoms)]
+    burned = features.rasterize(source_geoms, out_shape=(height, width),
+                                transform=grid_transform, fill=0, default_value=1,
+                                all_touched=True, dtype='uint8')
+
+    # Distance-to-nearest-road per pixel; thresholding it at the buffer
+    # distance is the dilation step, fused into a single EDT pass
+    distance = ndimage.distance_transform_edt(burned == 0) * resolution
+    excluded = distance <= buffer_meters
+
+    geoms = trails_gdf.geometry.values
+    valid_positions = np.flatnonzero(~shapely.is_missing(geoms))
+
+    keep_positions = []
+    keep_geoms = []
+    for position in valid_positions:
+        # Densify so consecutive samples are at most one pixel apart
+        for part in shapely.get_parts(shapely.segmentize(geoms[position], resolution)):
+            coords = shapely.get_coordinates(part)
+            rows = np.clip(((maxy - coords[:, 1]) / resolution).astype(int), 0, height - 1)
+            cols = np.clip(((coords[:, 0] - minx) / resolution).astype(int), 0, width - 1)
+            outside = ~excluded[rows, cols]
+
+            # Split the vertex run wherever it enters the exclusion mask
+            breaks = np.flatnonzero(np.diff(outside.astype(np.int8))) + 1
+            for run in np.split(np.arange(len(coords)), breaks):
+                if len(run) < 2 or not outside[run[0]]:
+                    continue
+                segment = LineString(coords[run])
+                if segment.length >= min_length_meters:
+                    keep_positions.append(position)
+                    keep_geoms.append(segment)
+
+    return build_segment_gdf(trails_gdf, np.asarray(keep_positions, dtype=int), keep_geoms)
+
+def save_trail_segments(gdf, output_path, driver='GPKG'):
+    """Save the trail segment GeoDataFrame to a vector file."""
+    # Assume UTM Zone 10N if no CRS is set
+    crs = gdf.crs if gdf.crs is not None else 'EPSG:32610'
+
+    # Convert back to WGS84 for output, through the shared cached transformer
+    wgs84_geometries = reproject_geometries(gdf.geometry.values, crs, 'EPSG:4326')
+    gdf_wgs84 = gpd.GeoDataFrame(gdf.drop(columns=gdf.geometry.name),
+                                 geometry=wgs84_geometries, crs='EPSG:4326')
+    gdf_wgs84.to_file(os.path.join("output", output_path), driver=driver, engine='pyogrio')
     print(f"Saved {len(gdf)} trail segments to {output_path}")
 
-def save_buffer_geojson(buffer_geometries, output_path, crs='EPSG:32610'):
-    """Save buffer geometries as GeoJSON."""
-    # Create a GeoDataFrame from the buffer geometries
-    data = [{'id': i+1} for i in range(len(buffer_geometries))]
-    buffer_gdf = gpd.GeoDataFrame(data, geometry=buffer_geometries, crs=crs)
-    
-    # Ensure the GeoDataFrame has a CRS before transformation
-    if buffer_gdf.crs is None:
-        buffer_gdf = buffer_gdf.set_crs(crs)
-    
-    # Convert to WGS84 for GeoJSON
-    buffer_gdf_wgs84 = buffer_gdf.to_crs('EPSG:4326')
-    
-    # Save as GeoJSON
-    buffer_gdf_wgs84.to_file(os.path.join("output", output_path), driver='GeoJSON')
+def save_buffer_geometries(buffer_geometries, output_path, crs='EPSG:32610', driver='GPKG'):
+    """Save buffer geometries to a vector file."""
+    # Reproject to WGS84 with one batched pyproj call over the raw
+    # coordinate array instead of transforming geometry by geometry
+    wgs84_geometries = reproject_geometries(buffer_geometries, crs, 'EPSG:4326')
+
+    # Create a GeoDataFrame from the reprojected buffers
+    data = {'id': np.arange(1, len(wgs84_geometries) + 1)}
+    buffer_gdf = gpd.GeoDataFrame(data, geometry=wgs84_geometries, crs='EPSG:4326')
+
+    buffer_gdf.to_file(os.path.join("output", output_path), driver=driver, engine='pyogrio')
     print(f"Saved {len(buffer_geometries)} buffer geometries to {output_path}")
 
 def compute_longest_trails(gdf):
@@ -231,23 +528,20 @@ def compute_longest_trails(gdf):
     
     print("\nAnalyzing trail lengths...")
     
-    # Calculate length for each trail segment
-    gdf['length_miles'] = gdf.geometry.length / 1609.34  # Convert meters to miles
-    
-    # Create a copy for grouping
-    gdf_copy = gdf.copy()
-    
+    # Calculate length for each trail segment in one vectorized C call
+    gdf['length_miles'] = shapely.length(gdf.geometry.values) / 1609.34  # Convert meters to miles
+
     # Find the trail name column
     trail_name_col = None
     for col in ['name', 'NAME', 'trail_name', 'TRAIL_NAME']:
-        if col in gdf_copy.columns:
+        if col in gdf.columns:
             trail_name_col = col
             break
-    
+
     if trail_name_col is None:
         print("No trail name column found. Showing individual segments.")
         # Fall back to original behavior
-        sorted_trails = gdf_copy.sort_values('length_miles', ascending=False)
+        sorted_trails = gdf.sort_values('length_miles', ascending=False)
         
         print(f"\nTop {len(sorted_trails):,} longest non-intersecting trail segments:")
         print(f"{'Rank':<5} {'Length (miles)':<15} {'Trail Info'}")
@@ -256,18 +550,22 @@ def compute_longest_trails(gdf):
         for i, (idx, trail) in enumerate(sorted_trails.iterrows()):
             trail_info = f"Trail {idx}"
             print(f"{i+1:<5} {trail['length_miles']:<15.2f} {trail_info}")
-        
-        total_length = gdf_copy['length_miles'].sum()
+
+        total_length = gdf['length_miles'].sum()
         print(f"\nTotal length of non-intersecting trail segments: {total_length:.2f} miles")
-        print(f"Average segment length: {gdf_copy['length_miles'].mean():.2f} miles")
+        print(f"Average segment length: {gdf['length_miles'].mean():.2f} miles")
         return
-    
-    # Group by trail name and sum lengths
-    trail_groups = gdf_copy.groupby(trail_name_col).agg({
-        'length_miles': 'sum',
-        'geometry': 'count'  # Count number of segments
-    }).rename(columns={'geometry': 'segment_count'})
-    
+
+    # Group by trail name: sum lengths and count segments in one pass each,
+    # without counting through the geometry column. Categorical codes let
+    # pandas group on integers instead of hashing a string per segment
+    gdf[trail_name_col] = gdf[trail_name_col].astype('category')
+    grouped = gdf.groupby(trail_name_col, observed=True)
+    trail_groups = pd.DataFrame({
+        'length_miles': grouped['length_miles'].sum(),
+        'segment_count': grouped.size(),
+    })
+
     # Sort by total length
     trail_groups = trail_groups.sort_values('length_miles', ascending=False)
     
@@ -287,21 +585,21 @@ def compute_longest_trails(gdf):
     print(f"{'Rank':<5} {'Length (miles)':<15} {'Trail Name'}")
     print("-" * 50)
     
-    sorted_segments = gdf_copy.sort_values('length_miles', ascending=False).head(10)
+    sorted_segments = gdf.sort_values('length_miles', ascending=False).head(10)
     for i, (idx, trail) in enumerate(sorted_segments.iterrows()):
         trail_name = trail[trail_name_col] if pd.notna(trail[trail_name_col]) else "Unnamed Trail"
         print(f"{i+1:<5} {trail['length_miles']:<15.2f} {trail_name}")
     
-    total_length = gdf_copy['length_miles'].sum()
+    total_length = gdf['length_miles'].sum()
     total_trails = len(trail_groups)
-    total_segments = len(gdf_copy)
+    total_segments = len(gdf)
     
     print(f"\nSummary:")
     print(f"Total length of non-intersecting trail segments: {total_length:.2f} miles")
     print(f"Number of unique trails: {total_trails}")
     print(f"Number of trail segments: {total_segments}")
     print(f"Average trail length: {total_length/total_trails:.2f} miles")
-    print(f"Average segment length: {gdf_copy['length_miles'].mean():.2f} miles")
+    print(f"Average segment length: {gdf['length_miles'].mean():.2f} miles")
 
 def main():
     """Main function to execute the trail buffer analysis."""
@@ -312,47 +610,110 @@ def main():
                        help='Minimum trail segment length in miles (default: 0.1)')
     parser.add_argument('--no-roads', action='store_true',
                        help='Exclude roads from buffer analysis')
-    parser.add_argument('--no-railways', action='store_true', 
+    parser.add_argument('--no-railways', action='store_true',
                        help='Exclude railways from buffer analysis')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Number of worker processes (default: all CPUs)')
+    parser.add_argument('--output-format', choices=sorted(OUTPUT_FORMATS), default='gpkg',
+                       help='Output file format (default: gpkg)')
+    parser.add_argument('--raster-mask', action='store_true',
+                       help='Use a rasterized exclusion mask instead of exact '
+                            'polygon buffers (faster, ~pixel accuracy)')
+    parser.add_argument('--raster-resolution', type=float, default=20.0,
+                       help='Raster mask pixel size in meters (default: 20)')
     
     args = parser.parse_args()
-    
+
     data_dir = "input"
+    driver, extension = OUTPUT_FORMATS[args.output_format]
     
     try:
-        # Step 1: Read Washington shapefiles and create buffers
-        print("Step 1: Reading Washington shapefiles...")
-        washington_gdf = read_specific_shapefiles(
-            data_dir, 
-            include_roads=not args.no_roads,
-            include_railways=not args.no_railways
-        )
-        
-        print(f"Step 2: Creating {args.buffer_miles}-mile buffers...")
-        buffer_geometries = create_buffers(washington_gdf, buffer_distance_miles=args.buffer_miles)
-        
-        # Save buffer geometries as GeoJSON
-        print(f"Step 2a: Saving buffer geometries")
-        save_buffer_geojson(buffer_geometries, f'{int(args.buffer_miles)}_mile_buffer.geojson')
-        
-        # Step 2: Read trails shapefile
-        print("Step 3: Reading trails shapefile...")
+        # Step 1: Read trails first so their extent can limit the other reads
+        print("Step 1: Reading trails shapefile...")
         trails_gdf = read_trails_shapefile(data_dir)
-        
-        # Step 3: Find non-intersecting segments
-        print("Step 4: Finding non-intersecting trail segments...")
-        non_intersecting_gdf = find_non_intersecting_segments(
-            trails_gdf, 
-            buffer_geometries, 
-            min_length_miles=args.min_segment_miles
-        )
-        
+
+        # Expand the trails extent by the buffer distance - roads just outside
+        # it can still buffer into the trail area - then express it in the
+        # source CRS of the OSM shapefiles
+        pad_meters = args.buffer_miles * 1609.34
+        trails_bbox = gpd.GeoSeries(
+            [shapely.box(*trails_gdf.total_bounds).buffer(pad_meters)],
+            crs=trails_gdf.crs).to_crs('EPSG:4326').total_bounds
+
+        if args.raster_mask:
+            # Steps 2-4 collapse into a single rasterized pass: no buffer
+            # polygons are built (and none are saved)
+            print("Step 2: Reading Washington shapefiles...")
+            washington_geoms = read_specific_shapefiles(
+                data_dir,
+                include_roads=not args.no_roads,
+                include_railways=not args.no_railways,
+                bbox=tuple(trails_bbox)
+            )
+            print("Step 3: Finding non-intersecting trail segments (raster mask)...")
+            non_intersecting_gdf = find_non_intersecting_segments_raster(
+                trails_gdf,
+                washington_geoms,
+                args.buffer_miles,
+                min_length_miles=args.min_segment_miles,
+                resolution=args.raster_resolution
+            )
+        else:
+            # The read -> reproject -> buffer prefix only depends on the
+            # source files and the buffer distance, so cache its product
+            # between runs (for interactive tuning of the other knobs)
+            cache_path = buffer_cache_path(data_dir, args.buffer_miles,
+                                           include_roads=not args.no_roads,
+                                           include_railways=not args.no_railways)
+            if cache_path.exists():
+                print(f"Steps 2-3: Loading cached buffers from {cache_path}...")
+                buffer_geometries = gpd.read_file(cache_path, engine='pyogrio').geometry.values
+            else:
+                print("Step 2: Reading Washington shapefiles...")
+                washington_geoms = read_specific_shapefiles(
+                    data_dir,
+                    include_roads=not args.no_roads,
+                    include_railways=not args.no_railways,
+                    bbox=tuple(trails_bbox)
+                )
+                print(f"Step 3: Creating {args.buffer_miles}-mile buffers...")
+                buffer_geometries = create_buffers(washington_geoms, buffer_distance_miles=args.buffer_miles)
+
+                cache_path.parent.mkdir(exist_ok=True)
+                gpd.GeoDataFrame(geometry=buffer_geometries, crs='EPSG:32610').to_file(
+                    cache_path, driver='FlatGeobuf', engine='pyogrio')
+                print(f"Cached buffers to {cache_path}")
+
+            # Save buffer geometries for inspection. The write is I/O-bound
+            # and independent of the trail analysis, so run it on a thread
+            # and overlap it with Step 4 (GEOS and pyogrio release the GIL)
+            print(f"Step 3a: Saving buffer geometries in the background")
+            save_executor = ThreadPoolExecutor(max_workers=1)
+            buffer_save_future = save_executor.submit(
+                save_buffer_geometries, buffer_geometries,
+                f'{int(args.buffer_miles)}_mile_buffer{extension}', driver=driver)
+
+            # Step 4: Find non-intersecting segments
+            print("Step 4: Finding non-intersecting trail segments...")
+            non_intersecting_gdf = find_non_intersecting_segments(
+                trails_gdf,
+                buffer_geometries,
+                min_length_miles=args.min_segment_miles,
+                max_workers=args.workers
+            )
+
+            # Surface any error from the background write before moving on
+            buffer_save_future.result()
+            save_executor.shutdown()
+
         if not non_intersecting_gdf.empty:
-            # Step 4: Save to GeoJSON
-            print("Step 5: Saving results to GeoJSON...")
-            save_geojson(non_intersecting_gdf, f'{int(args.buffer_miles)}_mile_backcountry_trails.geojson')
-            
-            # Step 5: Compute longest trails
+            # Step 5: Save results
+            print("Step 5: Saving results...")
+            save_trail_segments(non_intersecting_gdf,
+                                f'{int(args.buffer_miles)}_mile_backcountry_trails{extension}',
+                                driver=driver)
+
+            # Step 6: Compute longest trails
             print("Step 6: Computing longest trails...")
             compute_longest_trails(non_intersecting_gdf)
         else: